@@ -4,6 +4,7 @@ Django settings for credit_core project.
 
 import os
 from pathlib import Path
+from celery.schedules import crontab
 from decouple import config
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -127,6 +128,9 @@ CORS_ALLOWED_ORIGINS = [
     "http://127.0.0.1:8000",
 ]
 
+# Serve eligibility checks from a single raw SQL query instead of the ORM
+LOAN_ELIGIBILITY_RAW_SQL = config('LOAN_ELIGIBILITY_RAW_SQL', default=False, cast=bool)
+
 # Celery Configuration
 CELERY_BROKER_URL = config('CELERY_BROKER_URL', default='redis://localhost:6379/0')
 CELERY_RESULT_BACKEND = config('CELERY_RESULT_BACKEND', default='redis://localhost:6379/0')
@@ -134,7 +138,22 @@ CELERY_ACCEPT_CONTENT = ['json']
 CELERY_TASK_SERIALIZER = 'json'
 CELERY_RESULT_SERIALIZER = 'json'
 CELERY_TIMEZONE = TIME_ZONE
+CELERY_BEAT_SCHEDULE = {
+    # Drop matured loans from customers' current debt
+    'rebuild-current-debt': {
+        'task': 'loans.tasks.rebuild_current_debt',
+        'schedule': crontab(hour=0, minute=5),
+    },
+}
 
 # Redis Configuration
 REDIS_HOST = config('REDIS_HOST', default='localhost')
-REDIS_PORT = config('REDIS_PORT', default=6379, cast=int)
\ No newline at end of file
+REDIS_PORT = config('REDIS_PORT', default=6379, cast=int)
+
+# Cache Configuration
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': f'redis://{REDIS_HOST}:{REDIS_PORT}/1',
+    }
+}
\ No newline at end of file
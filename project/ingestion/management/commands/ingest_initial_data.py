@@ -2,24 +2,49 @@
 Management command to ingest initial data from Excel files.
 """
 from django.core.management.base import BaseCommand
-from ingestion.tasks import ingest_initial_data
+from ingestion.tasks import ingest_customer_data, ingest_initial_data, ingest_loans_after
 
 
 class Command(BaseCommand):
     help = 'Ingest initial customer and loan data from Excel files'
 
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--async',
+            action='store_true',
+            dest='async',
+            help='Dispatch ingestion to Celery workers instead of running it inline',
+        )
+
     def handle(self, *args, **options):
         self.stdout.write(
             self.style.SUCCESS('Starting data ingestion...')
         )
         
-        # Run the ingestion task
-        result = ingest_initial_data()
+        if options['async']:
+            # Fan customer chunks out to workers; loans follow via a chord
+            result = ingest_initial_data()
+            
+            if result.get('status') == 'dispatched':
+                self.stdout.write(
+                    self.style.SUCCESS(
+                        f"Data ingestion dispatched: {result.get('customer_chunks', 0)} "
+                        f"customer chunks, task id {result.get('task_id')}"
+                    )
+                )
+            else:
+                self.stdout.write(
+                    self.style.ERROR(
+                        f"Data ingestion dispatch failed: {result.get('message', 'Unknown error')}"
+                    )
+                )
+            return
         
-        # Display results
-        customer_result = result.get('customer_ingestion', {})
-        loan_result = result.get('loan_ingestion', {})
+        # Run the ingestion tasks inline: customers first, then loans
+        customer_result = ingest_customer_data()
+        loan_result = ingest_loans_after(customer_result)
         
+        # Display results
         if customer_result.get('status') == 'success':
             self.stdout.write(
                 self.style.SUCCESS(
@@ -43,6 +68,12 @@ class Command(BaseCommand):
                     f"{loan_result.get('loans_updated', 0)} updated"
                 )
             )
+        elif loan_result.get('status') == 'skipped':
+            self.stdout.write(
+                self.style.WARNING(
+                    f"Loan data ingestion skipped: {loan_result.get('message')}"
+                )
+            )
         else:
             self.stdout.write(
                 self.style.ERROR(
@@ -1,14 +1,222 @@
 """
 Celery tasks for data ingestion.
 """
+import itertools
+import logging
 import pandas as pd
 import os
-from datetime import datetime
-from decimal import Decimal
-from celery import shared_task
+from celery import chord, group, shared_task
 from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from openpyxl import load_workbook
 from customers.models import Customer
+from loans.cache import loan_cache_keys
 from loans.models import Loan
+from loans.tasks import rebuild_current_debt
+
+try:
+    import python_calamine  # noqa: F401
+    EXCEL_ENGINE = 'calamine'
+except ImportError:
+    EXCEL_ENGINE = 'openpyxl'
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 1000
+CHUNK_SIZE = 5000
+SKIPPED_SAMPLE_SIZE = 20
+
+# Excel column name -> Customer field name
+CUSTOMER_COLUMNS = {
+    'Customer ID': 'customer_id',
+    'First Name': 'first_name',
+    'Last Name': 'last_name',
+    'Phone Number': 'phone_number',
+    'Age': 'age',
+    'Monthly Salary': 'monthly_salary',
+    'Approved Limit': 'approved_limit',
+    'Current Debt': 'current_debt',
+}
+
+CUSTOMER_DTYPES = {
+    'Customer ID': 'int64',
+    'First Name': 'string',
+    'Last Name': 'string',
+    'Phone Number': 'string',
+    'Age': 'int32',
+    'Monthly Salary': 'int64',
+    'Approved Limit': 'int64',
+    'Current Debt': 'int64',
+}
+
+# current_debt is left out: for existing customers it is maintained from their
+# loans (see loans.tasks.rebuild_current_debt), not taken from the workbook
+CUSTOMER_UPDATE_FIELDS = [
+    'first_name', 'last_name', 'phone_number', 'age',
+    'monthly_salary', 'approved_limit', 'updated_at',
+]
+
+# Excel column name -> Loan field name
+LOAN_COLUMNS = {
+    'Customer ID': 'customer_id',
+    'Loan ID': 'loan_id',
+    'Loan Amount': 'loan_amount',
+    'Tenure': 'tenure',
+    'Interest Rate': 'interest_rate',
+    'Monthly payment': 'monthly_repayment',
+    'EMIs paid on Time': 'emis_paid_on_time',
+    'Date of Approval': 'start_date',
+    'End Date': 'end_date',
+}
+
+LOAN_DTYPES = {
+    'Customer ID': 'int64',
+    'Loan ID': 'int64',
+    'Loan Amount': 'float64',
+    'Tenure': 'int64',
+    'Interest Rate': 'float64',
+    'Monthly payment': 'float64',
+    'EMIs paid on Time': 'int64',
+}
+
+LOAN_UPDATE_FIELDS = [
+    'customer', 'loan_amount', 'tenure', 'interest_rate',
+    'monthly_repayment', 'emis_paid_on_time', 'start_date', 'end_date',
+    'updated_at',
+]
+
+
+def read_excel(file_path, dtype=None):
+    """
+    Read an Excel file with the fastest available engine.
+    """
+    return pd.read_excel(file_path, engine=EXCEL_ENGINE, dtype=dtype)
+
+
+def iter_excel_chunks(file_path, dtype=None, chunk_size=CHUNK_SIZE):
+    """
+    Yield DataFrames of at most chunk_size rows from the first sheet,
+    so only one chunk is held in memory at a time.
+    
+    Uses openpyxl in read-only mode, which streams rows from the file;
+    calamine loads the whole sheet before yielding the first row.
+    """
+    workbook = load_workbook(file_path, read_only=True, data_only=True)
+    rows = workbook.worksheets[0].iter_rows(values_only=True)
+    
+    try:
+        header = next(rows, None)
+        if header is None:
+            return
+        
+        while True:
+            batch = list(itertools.islice(rows, chunk_size))
+            if not batch:
+                break
+            df = pd.DataFrame(batch, columns=list(header))
+            yield df.astype(dtype) if dtype else df
+    finally:
+        workbook.close()
+
+
+def customer_data_path():
+    """Path of the customer data file in the project root."""
+    return os.path.join(settings.BASE_DIR, 'customer_data.xlsx')
+
+
+def read_customer_records(file_path):
+    """
+    Read the customer Excel file into a list of Customer field dicts.
+    """
+    df = read_excel(file_path, dtype=CUSTOMER_DTYPES).rename(columns=CUSTOMER_COLUMNS)
+    
+    # A repeated ID would hit ON CONFLICT twice in one INSERT; last row wins
+    df = df.drop_duplicates('customer_id', keep='last')
+    
+    # Same rule as registration: 36 x monthly salary, rounded to the nearest lakh
+    df['approved_limit'] = (
+        (df['monthly_salary'] * 36 / 100000).round().astype('int64') * 100000
+    )
+    
+    return df.to_dict('records')
+
+
+def split_chunks(records, chunk_size=CHUNK_SIZE):
+    """Split records into lists of at most chunk_size items."""
+    return [records[i:i + chunk_size] for i in range(0, len(records), chunk_size)]
+
+
+def merge_customer_results(results):
+    """
+    Combine per-chunk customer ingestion results into one summary.
+    Counts cover the chunks that succeeded, even when others failed.
+    """
+    succeeded = [r for r in results if r.get('status') == 'success']
+    failed = [r for r in results if r.get('status') != 'success']
+    
+    summary = {
+        "status": "error" if failed else "success",
+        "customers_created": sum(r['customers_created'] for r in succeeded),
+        "customers_updated": sum(r['customers_updated'] for r in succeeded),
+        "total_processed": sum(r['total_processed'] for r in succeeded)
+    }
+    
+    if failed:
+        summary["failed_chunks"] = len(failed)
+        summary["message"] = failed[0].get('message', 'Unknown error')
+    
+    return summary
+
+
+def upsert_customer_chunk(records):
+    """
+    Create or update one chunk of customer records.
+    """
+    # Existing IDs are only needed to report created vs updated counts
+    existing_ids = set(
+        Customer.objects.filter(
+            customer_id__in=[rec['customer_id'] for rec in records]
+        ).values_list('customer_id', flat=True)
+    )
+    
+    # Upsert in batches with INSERT ... ON CONFLICT (customer_id) DO UPDATE
+    customers = Customer.objects.bulk_create(
+        [Customer(**rec) for rec in records],
+        batch_size=BATCH_SIZE,
+        update_conflicts=True,
+        unique_fields=['customer_id'],
+        update_fields=CUSTOMER_UPDATE_FIELDS,
+    )
+    customers_updated = sum(1 for c in customers if c.customer_id in existing_ids)
+    
+    # Bulk writes send no model signals, so drop cached customer data here;
+    # loan details embed the customer's profile, so theirs go too
+    customer_ids = [c.customer_id for c in customers]
+    loan_ids = Loan.objects.filter(
+        customer_id__in=customer_ids
+    ).values_list('loan_id', flat=True)
+    keys = loan_cache_keys(loan_ids, customer_ids)
+    transaction.on_commit(lambda: cache.delete_many(keys))
+    
+    return {
+        "status": "success",
+        "customers_created": len(customers) - customers_updated,
+        "customers_updated": customers_updated,
+        "total_processed": len(records)
+    }
+
+
+@shared_task
+def ingest_customer_chunk(records):
+    """
+    Create or update one chunk of customer records as a chord header task.
+    """
+    try:
+        return upsert_customer_chunk(records)
+        
+    except Exception as e:
+        return {"status": "error", "message": str(e)}
 
 
 @shared_task
@@ -17,53 +225,19 @@ def ingest_customer_data():
     Ingest customer data from Excel file.
     """
     try:
-        # Look for customer data file in the project root
-        file_path = os.path.join(settings.BASE_DIR, 'customer_data.xlsx')
+        file_path = customer_data_path()
         
         if not os.path.exists(file_path):
             return {"status": "error", "message": "Customer data file not found"}
         
-        # Read Excel file
-        df = pd.read_excel(file_path)
-        
-        customers_created = 0
-        customers_updated = 0
-        
-        for _, row in df.iterrows():
-            customer_id = row.get('Customer ID')
-            first_name = row.get('First Name', '')
-            last_name = row.get('Last Name', '')
-            phone_number = str(row.get('Phone Number', ''))
-            age = int(row.get('Age', 0))
-            monthly_salary = int(row.get('Monthly Salary', 0))
-            approved_limit = int(row.get('Approved Limit', 0))
-            current_debt = int(row.get('Current Debt', 0))
-            
-            # Create or update customer
-            customer, created = Customer.objects.update_or_create(
-                customer_id=customer_id,
-                defaults={
-                    'first_name': first_name,
-                    'last_name': last_name,
-                    'phone_number': phone_number,
-                    'age': age,
-                    'monthly_salary': monthly_salary,
-                    'approved_limit': approved_limit,
-                    'current_debt': current_debt,
-                }
-            )
-            
-            if created:
-                customers_created += 1
-            else:
-                customers_updated += 1
+        records = read_customer_records(file_path)
         
-        return {
-            "status": "success",
-            "customers_created": customers_created,
-            "customers_updated": customers_updated,
-            "total_processed": len(df)
-        }
+        # One transaction for every chunk, so a failing chunk rolls back the
+        # whole file instead of leaving earlier chunks committed
+        with transaction.atomic():
+            results = [upsert_customer_chunk(chunk) for chunk in split_chunks(records)]
+        
+        return merge_customer_results(results)
         
     except Exception as e:
         return {"status": "error", "message": str(e)}
@@ -81,84 +255,149 @@ def ingest_loan_data():
         if not os.path.exists(file_path):
             return {"status": "error", "message": "Loan data file not found"}
         
-        # Read Excel file
-        df = pd.read_excel(file_path)
-        
         loans_created = 0
         loans_updated = 0
+        loans_skipped = 0
+        skipped_sample = []
+        total_processed = 0
         
-        for _, row in df.iterrows():
-            customer_id = row.get('Customer ID')
-            loan_id = row.get('Loan ID')
-            loan_amount = Decimal(str(row.get('Loan Amount', 0)))
-            tenure = int(row.get('Tenure', 0))
-            interest_rate = Decimal(str(row.get('Interest Rate', 0)))
-            monthly_payment = Decimal(str(row.get('Monthly payment', 0)))
-            emis_paid_on_time = int(row.get('EMIs paid on Time', 0))
-            
-            # Parse dates
-            date_of_approval = row.get('Date of Approval')
-            end_date = row.get('End Date')
-            
-            # Convert date strings to date objects
-            if isinstance(date_of_approval, str):
-                start_date = datetime.strptime(date_of_approval, '%d-%m-%Y').date()
-            else:
-                start_date = date_of_approval
+        # Load all customer IDs once instead of querying per loan
+        customer_ids = set(Customer.objects.values_list('customer_id', flat=True))
+        
+        # One transaction for every chunk and the debt rebuild, so a failing
+        # chunk leaves neither half-ingested loans nor a stale current_debt
+        with transaction.atomic():
+            # Stream the Excel file in chunks to bound memory usage
+            for df in iter_excel_chunks(file_path, dtype=LOAN_DTYPES):
+                df = df.rename(columns=LOAN_COLUMNS)
+                total_processed += len(df)
                 
-            if isinstance(end_date, str):
-                end_date = datetime.strptime(end_date, '%d-%m-%Y').date()
-            
-            try:
-                customer = Customer.objects.get(customer_id=customer_id)
+                # A repeated ID would hit ON CONFLICT twice in one INSERT; last row wins
+                df = df.drop_duplicates('loan_id', keep='last')
                 
-                # Create or update loan
-                loan, created = Loan.objects.update_or_create(
-                    loan_id=loan_id,
-                    defaults={
-                        'customer': customer,
-                        'loan_amount': loan_amount,
-                        'tenure': tenure,
-                        'interest_rate': interest_rate,
-                        'monthly_repayment': monthly_payment,
-                        'emis_paid_on_time': emis_paid_on_time,
-                        'start_date': start_date,
-                        'end_date': end_date,
-                    }
+                # Parse date strings to date objects in one vectorized pass
+                for field in ('start_date', 'end_date'):
+                    df[field] = pd.to_datetime(
+                        df[field], format='%d-%m-%Y', errors='coerce'
+                    ).dt.date
+                
+                # Derive missing monthly payments from the loan terms in one pass
+                missing_emi = df['monthly_repayment'].isna()
+                if missing_emi.any():
+                    terms = df.loc[missing_emi]
+                    df.loc[missing_emi, 'monthly_repayment'] = Loan.calculate_emi_array(
+                        terms['loan_amount'], terms['interest_rate'], terms['tenure']
+                    )
+                
+                # Drop loans whose customer does not exist
+                known = df['customer_id'].isin(customer_ids)
+                if not known.all():
+                    missing = df.loc[~known, ['customer_id', 'loan_id']]
+                    loans_skipped += len(missing)
+                    skipped_sample.extend(
+                        missing.head(SKIPPED_SAMPLE_SIZE - len(skipped_sample)).values.tolist()
+                    )
+                
+                records = df[known].to_dict('records')
+                # Existing IDs are only needed to report created vs updated counts
+                existing_ids = set(
+                    Loan.objects.filter(
+                        loan_id__in=[rec['loan_id'] for rec in records]
+                    ).values_list('loan_id', flat=True)
+                )
+                
+                # Upsert in batches with INSERT ... ON CONFLICT (loan_id) DO UPDATE
+                loans = Loan.objects.bulk_create(
+                    [Loan(**rec) for rec in records],
+                    batch_size=BATCH_SIZE,
+                    update_conflicts=True,
+                    unique_fields=['loan_id'],
+                    update_fields=LOAN_UPDATE_FIELDS,
+                )
+                chunk_updated = sum(1 for loan in loans if loan.loan_id in existing_ids)
+                
+                # Bulk writes send no model signals, so drop cached loan data here,
+                # once the run commits so reads meanwhile cannot re-cache old rows
+                keys = loan_cache_keys(
+                    [loan.loan_id for loan in loans],
+                    {loan.customer_id for loan in loans}
                 )
+                transaction.on_commit(lambda keys=keys: cache.delete_many(keys))
                 
-                if created:
-                    loans_created += 1
-                else:
-                    loans_updated += 1
-                    
-            except Customer.DoesNotExist:
-                print(f"Customer with ID {customer_id} not found for loan {loan_id}")
-                continue
+                loans_created += len(loans) - chunk_updated
+                loans_updated += chunk_updated
+            
+            if loans_skipped:
+                logger.warning(
+                    "Skipped %d loans with missing customers; sample (customer_id, loan_id): %s",
+                    loans_skipped, skipped_sample
+                )
+            
+            # Sync customers' outstanding debt with the ingested loans
+            rebuild_current_debt()
         
         return {
             "status": "success",
             "loans_created": loans_created,
             "loans_updated": loans_updated,
-            "total_processed": len(df)
+            "loans_skipped": loans_skipped,
+            "total_processed": total_processed
         }
         
     except Exception as e:
         return {"status": "error", "message": str(e)}
 
 
-@shared_task
-def ingest_initial_data():
+def ingest_loans_after(customer_result):
     """
-    Ingest both customer and loan data.
+    Ingest loans unless customer ingestion failed, since loans for the
+    missing customers would otherwise be silently skipped.
     """
-    # First ingest customers
-    customer_result = ingest_customer_data()
+    if customer_result.get('status') != 'success':
+        return {
+            "status": "skipped",
+            "message": "Customer ingestion failed; loans were not ingested"
+        }
     
-    # Then ingest loans
-    loan_result = ingest_loan_data()
+    return ingest_loan_data()
+
+
+@shared_task
+def ingest_loans_after_customers(customer_results):
+    """
+    Chord callback: ingest loans once every customer chunk has finished.
+    """
+    customer_result = merge_customer_results(customer_results)
     
     return {
         "customer_ingestion": customer_result,
-        "loan_ingestion": loan_result
-    }
\ No newline at end of file
+        "loan_ingestion": ingest_loans_after(customer_result)
+    }
+
+
+@shared_task
+def ingest_initial_data():
+    """
+    Ingest both customer and loan data.
+    
+    Customer chunks are ingested in parallel across workers; loans depend on
+    customers, so they are ingested by the chord callback afterwards.
+    """
+    try:
+        file_path = customer_data_path()
+        
+        if not os.path.exists(file_path):
+            return {"status": "error", "message": "Customer data file not found"}
+        
+        chunks = split_chunks(read_customer_records(file_path))
+        header = group(ingest_customer_chunk.s(chunk) for chunk in chunks)
+        result = chord(header)(ingest_loans_after_customers.s())
+        
+        return {
+            "status": "dispatched",
+            "task_id": result.id,
+            "customer_chunks": len(chunks)
+        }
+        
+    except Exception as e:
+        return {"status": "error", "message": str(e)}
@@ -0,0 +1,30 @@
+"""
+Cache keys and timeouts for loan-related data.
+"""
+
+CREDIT_SCORE_TIMEOUT = 300  # seconds
+LOAN_VIEW_TIMEOUT = 600  # seconds
+
+
+def credit_score_key(customer_id):
+    """Cache key for a customer's credit score."""
+    return f"credit_score:{customer_id}"
+
+
+def loan_detail_key(loan_id):
+    """Cache key for a serialized loan detail response."""
+    return f"loan:{loan_id}"
+
+
+def customer_loans_key(customer_id):
+    """Cache key for a serialized list of a customer's current loans."""
+    return f"custloans:{customer_id}"
+
+
+def loan_cache_keys(loan_ids, customer_ids):
+    """Every cache key derived from the given loans and their customers."""
+    return (
+        [loan_detail_key(loan_id) for loan_id in loan_ids]
+        + [customer_loans_key(customer_id) for customer_id in customer_ids]
+        + [credit_score_key(customer_id) for customer_id in customer_ids]
+    )
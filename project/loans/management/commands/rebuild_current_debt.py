@@ -0,0 +1,18 @@
+"""
+Management command to rebuild customers' current debt from their loans.
+"""
+from django.core.management.base import BaseCommand
+from loans.tasks import rebuild_current_debt
+
+
+class Command(BaseCommand):
+    help = "Recompute each customer's current debt from their active loans"
+
+    def handle(self, *args, **options):
+        result = rebuild_current_debt()
+        
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Current debt rebuilt for {result.get('customers_updated', 0)} customers"
+            )
+        )
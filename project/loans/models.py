@@ -5,6 +5,7 @@ from django.db import models
 from customers.models import Customer
 from decimal import Decimal
 import math
+import numpy as np
 
 
 class Loan(models.Model):
@@ -27,6 +28,12 @@ class Loan(models.Model):
     class Meta:
         db_table = 'loans'
         ordering = ['-created_at']
+        indexes = [
+            # Current-loan lookups (end_date >= today) per customer
+            models.Index(fields=['customer', 'end_date'], name='loans_customer_end_date_idx'),
+            # Current-year loan counts per customer
+            models.Index(fields=['customer', 'start_date'], name='loans_customer_start_idx'),
+        ]
 
     def __str__(self):
         return f"Loan {self.loan_id} - {self.customer.full_name}"
@@ -40,10 +47,30 @@ class Loan(models.Model):
         if annual_rate == 0:
             return float(principal) / tenure_months
         
-        monthly_rate = float(annual_rate) / 12 / 100
-        emi = float(principal) * monthly_rate * (1 + monthly_rate) ** tenure_months / ((1 + monthly_rate) ** tenure_months - 1)
+        monthly_rate = float(annual_rate) / 1200
+        growth = (1 + monthly_rate) ** tenure_months  # (1 + r)^n, computed once
+        emi = float(principal) * monthly_rate * growth / (growth - 1)
         return round(emi, 2)
 
+    @staticmethod
+    def calculate_emi_array(principal, annual_rate, tenure_months):
+        """
+        Vectorized calculate_emi over arrays of loan terms.
+        Returns a NumPy array of EMIs rounded to 2 decimals.
+        """
+        principal = np.asarray(principal, dtype=float)
+        monthly_rate = np.asarray(annual_rate, dtype=float) / 1200
+        tenure_months = np.asarray(tenure_months, dtype=float)
+        
+        growth = np.power(1 + monthly_rate, tenure_months)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            emi = np.where(
+                monthly_rate == 0,
+                principal / tenure_months,
+                principal * monthly_rate * growth / (growth - 1)
+            )
+        return np.round(emi, 2)
+
     @property
     def repayments_left(self):
         """Calculate remaining EMIs."""
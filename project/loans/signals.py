@@ -0,0 +1,22 @@
+"""
+Signal handlers for the loans app.
+"""
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .cache import loan_cache_keys
+from .models import Loan
+
+
+@receiver(post_save, sender=Loan)
+@receiver(post_delete, sender=Loan)
+def invalidate_loan_cache(sender, instance, **kwargs):
+    """
+    Drop cached data derived from a loan when it is written or deleted.
+    
+    Deferred until commit so a concurrent read cannot re-cache the old data.
+    """
+    keys = loan_cache_keys([instance.loan_id], [instance.customer_id])
+    transaction.on_commit(lambda: cache.delete_many(keys))
@@ -0,0 +1,28 @@
+"""
+Celery tasks for loan maintenance.
+"""
+from celery import shared_task
+from django.db.models import IntegerField, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from customers.models import Customer
+from .models import Loan
+
+
+@shared_task
+def rebuild_current_debt():
+    """
+    Recompute every customer's current_debt from their active loans.
+    """
+    active_debt = Loan.objects.filter(
+        customer=OuterRef('pk'),
+        end_date__gte=timezone.now().date()
+    ).order_by().values('customer').annotate(
+        total=Sum('loan_amount')
+    ).values('total')
+    
+    customers_updated = Customer.objects.update(
+        current_debt=Coalesce(Subquery(active_debt, output_field=IntegerField()), 0)
+    )
+    
+    return {"status": "success", "customers_updated": customers_updated}
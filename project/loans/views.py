@@ -4,12 +4,19 @@ Views for loan-related API endpoints.
 from rest_framework import status
 from rest_framework.decorators import api_view
 from rest_framework.response import Response
+from django.conf import settings
+from django.core.cache import cache
 from django.shortcuts import get_object_or_404
 from django.utils import timezone
-from django.db.models import Sum, Q
+from django.db import connection, transaction
+from django.db.models import Count, F, Sum, Q
 from datetime import timedelta, date
 from decimal import Decimal
 
+from .cache import (
+    credit_score_key, customer_loans_key, loan_detail_key,
+    CREDIT_SCORE_TIMEOUT, LOAN_VIEW_TIMEOUT
+)
 from .models import Loan
 from customers.models import Customer
 from .serializers import (
@@ -18,49 +25,87 @@ from .serializers import (
     LoanDetailSerializer, CustomerLoanSerializer
 )
 
+# Customer columns read by the credit score and approval checks
+ELIGIBILITY_FIELDS = ('customer_id', 'monthly_salary', 'approved_limit', 'current_debt')
+
+# Customer row plus all loan aggregates for the eligibility check, in one query
+ELIGIBILITY_SNAPSHOT_SQL = """
+    SELECT c.customer_id, c.monthly_salary, c.approved_limit, c.current_debt,
+           COUNT(l.loan_id),
+           SUM(l.tenure),
+           SUM(l.emis_paid_on_time),
+           COUNT(l.loan_id) FILTER (WHERE l.start_date BETWEEN %s AND %s),
+           SUM(l.loan_amount) FILTER (WHERE l.end_date >= %s),
+           SUM(l.monthly_repayment) FILTER (WHERE l.end_date >= %s)
+    FROM customers c
+    LEFT JOIN loans l ON l.customer_id = c.customer_id
+    WHERE c.customer_id = %s
+    GROUP BY c.customer_id
+"""
+
 
 def calculate_credit_score(customer):
+    """
+    Return the customer's credit score, cached for CREDIT_SCORE_TIMEOUT seconds.
+    """
+    key = credit_score_key(customer.customer_id)
+    score = cache.get(key)
+    
+    if score is None:
+        score = compute_credit_score(customer)
+        cache.set(key, score, CREDIT_SCORE_TIMEOUT)
+    
+    return score
+
+
+def compute_credit_score(customer):
     """
     Calculate credit score based on customer's loan history.
     Score ranges from 0-100.
     """
-    loans = Loan.objects.filter(customer=customer)
+    now = timezone.now()
     
-    if not loans.exists():
+    # Gather every score input in a single query
+    stats = Loan.objects.filter(customer_id=customer.customer_id).aggregate(
+        loan_count=Count('loan_id'),
+        total_emis=Sum('tenure'),
+        paid_on_time=Sum('emis_paid_on_time'),
+        current_year_loans=Count('loan_id', filter=Q(start_date__year=now.year)),
+        total_current_amount=Sum('loan_amount', filter=Q(end_date__gte=now.date())),
+    )
+    
+    return score_from_loan_stats(stats, customer.approved_limit)
+
+
+def score_from_loan_stats(stats, approved_limit):
+    """
+    Turn a customer's loan aggregates into a credit score from 0-100.
+    """
+    if not stats['loan_count']:
         return 50  # Default score for new customers
     
     score = 0
     
     # Factor 1: Past loans paid on time (40 points max)
-    total_emis = loans.aggregate(
-        total_emis=Sum('tenure'),
-        paid_on_time=Sum('emis_paid_on_time')
-    )
-    
-    if total_emis['total_emis'] and total_emis['total_emis'] > 0:
-        on_time_ratio = total_emis['paid_on_time'] / total_emis['total_emis']
+    if stats['total_emis'] and stats['total_emis'] > 0:
+        on_time_ratio = stats['paid_on_time'] / stats['total_emis']
         score += min(40, on_time_ratio * 40)
     
     # Factor 2: Number of past loans (20 points max, diminishing returns)
-    loan_count = loans.count()
+    loan_count = stats['loan_count']
     if loan_count <= 5:
         score += loan_count * 4  # 4 points per loan up to 5 loans
     else:
         score += 20  # Max 20 points
     
     # Factor 3: Loan activity in current year (20 points max)
-    current_year = timezone.now().year
-    current_year_loans = loans.filter(start_date__year=current_year).count()
-    score += min(20, current_year_loans * 5)
+    score += min(20, stats['current_year_loans'] * 5)
     
     # Factor 4: Loan approved volume vs limit (20 points max)
-    current_loans = loans.filter(end_date__gte=timezone.now().date())
-    total_current_amount = current_loans.aggregate(
-        total=Sum('loan_amount')
-    )['total'] or 0
+    total_current_amount = stats['total_current_amount'] or 0
     
-    if customer.approved_limit > 0:
-        utilization_ratio = float(total_current_amount) / customer.approved_limit
+    if approved_limit > 0:
+        utilization_ratio = float(total_current_amount) / approved_limit
         if utilization_ratio <= 0.5:
             score += 20
         elif utilization_ratio <= 0.75:
@@ -73,20 +118,15 @@ def calculate_credit_score(customer):
     return min(100, max(0, int(score)))
 
 
-def get_approval_decision(credit_score, customer, loan_amount, requested_rate, tenure):
+def get_approval_decision(credit_score, customer, loan_amount, requested_rate, tenure,
+                          current_emis=None):
     """
     Determine loan approval based on credit score and other factors.
+    current_emis is the sum of the customer's current EMIs; it is queried
+    when not supplied.
     """
-    # Check if sum of current loans exceeds approved limit
-    current_loans = Loan.objects.filter(
-        customer=customer,
-        end_date__gte=timezone.now().date()
-    )
-    current_loan_sum = current_loans.aggregate(
-        total=Sum('loan_amount')
-    )['total'] or 0
-    
-    if current_loan_sum + loan_amount > customer.approved_limit:
+    # Check if outstanding debt plus the new loan exceeds approved limit
+    if customer.current_debt + loan_amount > customer.approved_limit:
         return False, requested_rate, "Loan amount exceeds approved limit"
     
     # Credit score based approval
@@ -106,9 +146,13 @@ def get_approval_decision(credit_score, customer, loan_amount, requested_rate, t
     corrected_rate = max(float(requested_rate), min_interest)
     monthly_emi = Loan.calculate_emi(loan_amount, corrected_rate, tenure)
     
-    current_emis = current_loans.aggregate(
-        total_emi=Sum('monthly_repayment')
-    )['total_emi'] or 0
+    if current_emis is None:
+        current_emis = Loan.objects.filter(
+            customer=customer,
+            end_date__gte=timezone.now().date()
+        ).aggregate(
+            total_emi=Sum('monthly_repayment')
+        )['total_emi'] or 0
     
     total_emi = monthly_emi + float(current_emis)
     
@@ -118,6 +162,57 @@ def get_approval_decision(credit_score, customer, loan_amount, requested_rate, t
     return approved, corrected_rate, "Approved"
 
 
+def fetch_eligibility_snapshot(customer_id):
+    """
+    Load the customer and every loan aggregate the eligibility check needs in
+    a single raw SQL round-trip.
+    Returns (customer, credit_score, current_emis), or None if not found.
+    """
+    today = timezone.now().date()
+    
+    with connection.cursor() as cursor:
+        cursor.execute(ELIGIBILITY_SNAPSHOT_SQL, [
+            date(today.year, 1, 1), date(today.year, 12, 31),
+            today, today, customer_id
+        ])
+        row = cursor.fetchone()
+    
+    if row is None:
+        return None
+    
+    customer = Customer(
+        customer_id=row[0],
+        monthly_salary=row[1],
+        approved_limit=row[2],
+        current_debt=row[3]
+    )
+    stats = {
+        'loan_count': row[4],
+        'total_emis': row[5],
+        'paid_on_time': row[6],
+        'current_year_loans': row[7],
+        'total_current_amount': row[8],
+    }
+    
+    return customer, score_from_loan_stats(stats, customer.approved_limit), row[9] or 0
+
+
+def load_eligibility(customer_id):
+    """
+    Return (customer, credit_score, current_emis) for a customer, or None if
+    not found. current_emis is None when get_approval_decision should query it.
+    """
+    if settings.LOAN_ELIGIBILITY_RAW_SQL:
+        return fetch_eligibility_snapshot(customer_id)
+    
+    try:
+        customer = Customer.objects.only(*ELIGIBILITY_FIELDS).get(customer_id=customer_id)
+    except Customer.DoesNotExist:
+        return None
+    
+    return customer, calculate_credit_score(customer), None
+
+
 @api_view(['POST'])
 def check_eligibility(request):
     """
@@ -134,20 +229,18 @@ def check_eligibility(request):
     interest_rate = data['interest_rate']
     tenure = data['tenure']
     
-    try:
-        customer = Customer.objects.get(customer_id=customer_id)
-    except Customer.DoesNotExist:
+    # Load customer and calculate credit score
+    eligibility = load_eligibility(customer_id)
+    if eligibility is None:
         return Response(
             {"error": "Customer not found"}, 
             status=status.HTTP_404_NOT_FOUND
         )
-    
-    # Calculate credit score
-    credit_score = calculate_credit_score(customer)
+    customer, credit_score, current_emis = eligibility
     
     # Get approval decision
     approval, corrected_rate, message = get_approval_decision(
-        credit_score, customer, loan_amount, interest_rate, tenure
+        credit_score, customer, loan_amount, interest_rate, tenure, current_emis
     )
     
     # Calculate monthly installment
@@ -188,18 +281,17 @@ def create_loan(request):
     interest_rate = data['interest_rate']
     tenure = data['tenure']
     
-    try:
-        customer = Customer.objects.get(customer_id=customer_id)
-    except Customer.DoesNotExist:
+    eligibility = load_eligibility(customer_id)
+    if eligibility is None:
         return Response(
             {"error": "Customer not found"}, 
             status=status.HTTP_404_NOT_FOUND
         )
+    customer, credit_score, current_emis = eligibility
     
     # Check eligibility
-    credit_score = calculate_credit_score(customer)
     approval, corrected_rate, message = get_approval_decision(
-        credit_score, customer, loan_amount, interest_rate, tenure
+        credit_score, customer, loan_amount, interest_rate, tenure, current_emis
     )
     
     if approval:
@@ -208,15 +300,21 @@ def create_loan(request):
         start_date = timezone.now().date()
         end_date = start_date + timedelta(days=tenure * 30)  # Approximate
         
-        loan = Loan.objects.create(
-            customer=customer,
-            loan_amount=loan_amount,
-            tenure=tenure,
-            interest_rate=Decimal(str(corrected_rate)),
-            monthly_repayment=Decimal(str(monthly_installment)),
-            start_date=start_date,
-            end_date=end_date
-        )
+        with transaction.atomic():
+            loan = Loan.objects.create(
+                customer=customer,
+                loan_amount=loan_amount,
+                tenure=tenure,
+                interest_rate=Decimal(str(corrected_rate)),
+                monthly_repayment=Decimal(str(monthly_installment)),
+                start_date=start_date,
+                end_date=end_date
+            )
+            
+            # Keep the customer's outstanding debt in step with their loans
+            Customer.objects.filter(customer_id=customer_id).update(
+                current_debt=F('current_debt') + loan_amount
+            )
         
         response_data = {
             'loan_id': loan.loan_id,
@@ -245,9 +343,15 @@ def view_loan(request, loan_id):
     """
     View loan details with customer information.
     """
-    loan = get_object_or_404(Loan, loan_id=loan_id)
-    serializer = LoanDetailSerializer(loan)
-    return Response(serializer.data, status=status.HTTP_200_OK)
+    key = loan_detail_key(loan_id)
+    data = cache.get(key)
+    
+    if data is None:
+        loan = get_object_or_404(Loan.objects.select_related('customer'), loan_id=loan_id)
+        data = LoanDetailSerializer(loan).data
+        cache.set(key, data, LOAN_VIEW_TIMEOUT)
+    
+    return Response(data, status=status.HTTP_200_OK)
 
 
 @api_view(['GET'])
@@ -255,9 +359,13 @@ def view_customer_loans(request, customer_id):
     """
     View all current loans for a customer.
     """
-    try:
-        customer = Customer.objects.get(customer_id=customer_id)
-    except Customer.DoesNotExist:
+    key = customer_loans_key(customer_id)
+    data = cache.get(key)
+    
+    if data is not None:
+        return Response(data, status=status.HTTP_200_OK)
+    
+    if not Customer.objects.filter(customer_id=customer_id).exists():
         return Response(
             {"error": "Customer not found"}, 
             status=status.HTTP_404_NOT_FOUND
@@ -265,9 +373,14 @@ def view_customer_loans(request, customer_id):
     
     # Get current loans (end_date >= today)
     current_loans = Loan.objects.filter(
-        customer=customer,
+        customer_id=customer_id,
         end_date__gte=timezone.now().date()
+    ).only(
+        'loan_id', 'loan_amount', 'interest_rate', 'monthly_repayment',
+        'tenure', 'emis_paid_on_time'
     )
     
-    serializer = CustomerLoanSerializer(current_loans, many=True)
-    return Response(serializer.data, status=status.HTTP_200_OK)
\ No newline at end of file
+    data = CustomerLoanSerializer(current_loans, many=True).data
+    cache.set(key, data, LOAN_VIEW_TIMEOUT)
+    
+    return Response(data, status=status.HTTP_200_OK)
\ No newline at end of file